@@ -1,51 +1,87 @@
+import hashlib
 import pandas as pd
 import numpy as np
+import heapq
 import json
 import os
+import random
 import re
 from datetime import datetime, date
 from typing import List, Dict, Tuple
 from models import User, Lesson, Shift
 
 import streamlit as st
+from streamlit.runtime.uploaded_file_manager import UploadedFile
 try:
     from supabase import create_client, Client
 except ImportError:
     create_client = None
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 DATA_FILE = "users.json"
+BATCH_SIZE = 500  # rows per Supabase upsert; avoids oversized single requests
+
+# Compiled once; the parser runs these against every non-empty cell.
+# Header cells look like "lun 15/09", times like "09:30 - 13:30" / "09.30-13.30"
+_DATE_RE = re.compile(r"(lun|mar|mer|gio|ven|sab|dom).*?(\d{1,2})/(\d{1,2})")
+_TIME_RE = re.compile(r"(\d{1,2}[:\.]\d{2})\s*-\s*(\d{1,2}[:\.]\d{2})")
+
+# Module-level memo: st.cache_resource is a no-op outside the Streamlit
+# runtime (bare scripts, tests), so keep our own single-client fallback too.
+_supabase_client = None
+
+@st.cache_resource(show_spinner=False)
+def get_supabase_client():
+    """Returns a shared Supabase client if secrets are set, else None.
+
+    Cached as a resource so the client (and its pooled HTTP connections)
+    is created once per server process instead of on every rerun.
+    """
+    global _supabase_client
+    if _supabase_client is not None:
+        return _supabase_client
+    try:
+        url, key = None, None
+
+        # 1. Try Top-Level (SUPABASE_URL)
+        if "SUPABASE_URL" in st.secrets:
+            url = st.secrets["SUPABASE_URL"]
+            key = st.secrets["SUPABASE_KEY"]
+
+        # 2. Try Section (supabase.URL) - Standard Streamlit pattern
+        elif "supabase" in st.secrets:
+            if "URL" in st.secrets["supabase"]:
+                url = st.secrets["supabase"]["URL"]
+                key = st.secrets["supabase"]["KEY"]
+            elif "url" in st.secrets["supabase"]: # Lowercase check
+                url = st.secrets["supabase"]["url"]
+                key = st.secrets["supabase"]["key"]
+
+        if url and key:
+            _supabase_client = create_client(url, key)
+            return _supabase_client
+
+    except FileNotFoundError:
+        pass # No secrets file
+    except Exception as e:
+        print(f"Supabase init error: {e}")
+    return None
 
 class DataManager:
     @staticmethod
     def _get_supabase():
         """Returns Supabase client if secrets are set, else None."""
-        try:
-            url, key = None, None
-            
-            # 1. Try Top-Level (SUPABASE_URL)
-            if "SUPABASE_URL" in st.secrets:
-                url = st.secrets["SUPABASE_URL"]
-                key = st.secrets["SUPABASE_KEY"]
-            
-            # 2. Try Section (supabase.URL) - Standard Streamlit pattern
-            elif "supabase" in st.secrets:
-                if "URL" in st.secrets["supabase"]:
-                    url = st.secrets["supabase"]["URL"]
-                    key = st.secrets["supabase"]["KEY"]
-                elif "url" in st.secrets["supabase"]: # Lowercase check
-                    url = st.secrets["supabase"]["url"]
-                    key = st.secrets["supabase"]["key"]
-
-            if url and key:
-                return create_client(url, key)
-                
-        except FileNotFoundError:
-            pass # No secrets file
-        except Exception as e:
-            print(f"Supabase init error: {e}")
-        return None
+        return get_supabase_client()
 
     @staticmethod
+    @st.cache_data(ttl=300, show_spinner=False)
     def load_users() -> List[User]:
         sb = DataManager._get_supabase()
         if sb:
@@ -65,9 +101,13 @@ class DataManager:
         if not os.path.exists(DATA_FILE):
             return []
         try:
-            with open(DATA_FILE, 'r') as f:
-                data = json.load(f)
-                return [User.from_dict(u) for u in data]
+            if orjson is not None:
+                with open(DATA_FILE, 'rb') as f:
+                    data = orjson.loads(f.read())
+            else:
+                with open(DATA_FILE, 'r') as f:
+                    data = json.load(f)
+            return [User.from_dict(u) for u in data]
         except Exception as e:
             print(f"Error loading users: {e}")
             return []
@@ -79,6 +119,9 @@ class DataManager:
             try:
                 # Delete specific user by email
                 sb.table("users").delete().eq("email", user.email).execute()
+                # Drop the cached roster so the deleted user can't reappear
+                # from a stale read before the TTL expires
+                DataManager.load_users.clear()
             except Exception as e:
                 st.error(f"Errore eliminazione Supabase: {e}")
         else:
@@ -95,36 +138,61 @@ class DataManager:
         sb = DataManager._get_supabase()
         if sb:
             try:
-                # Upsert all users
-                # We convert all users to dicts
-                users_data = [u.to_dict() for u in users]
-                
-                # Perform upsert
+                # Only send rows that actually changed since the last save
+                dirty = [u for u in users if u._dirty]
+                users_data = [u.to_dict() for u in dirty]
+
+                # Perform upsert in chunks
                 # 'email' should be the primary key in Supabase
-                sb.table("users").upsert(users_data).execute()
+                for i in range(0, len(users_data), BATCH_SIZE):
+                    sb.table("users").upsert(users_data[i:i + BATCH_SIZE]).execute()
+                for u in dirty:
+                    u._dirty = False
             except Exception as e:
                 st.error(f"Errore salvataggio Database: {e}")
         else:
-            # Fallback to Local JSON
+            # Fallback to Local JSON: compact bytes into a temp file, then an
+            # atomic rename so a crash mid-write can't leave a torn users.json
             try:
-                with open(DATA_FILE, 'w') as f:
-                    json.dump([u.to_dict() for u in users], f, indent=4)
+                payload = [u.to_dict() for u in users]
+                if orjson is not None:
+                    raw = orjson.dumps(payload)
+                else:
+                    raw = json.dumps(payload, separators=(',', ':')).encode()
+                tmp = DATA_FILE + ".tmp"
+                with open(tmp, 'wb') as f:
+                    f.write(raw)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, DATA_FILE)
+                for u in users:
+                    u._dirty = False
             except Exception as e:
                 print(f"Error saving users: {e}")
+        # Invalidate the cached loader so the next read sees fresh data
+        DataManager.load_users.clear()
 
     @staticmethod
-    def load_shifts(all_users: List[User]) -> List[Shift]:
+    @st.cache_data(ttl=300, show_spinner=False)
+    def _load_shift_rows() -> List[dict]:
         sb = DataManager._get_supabase()
         if sb:
             try:
                 response = sb.table("shifts").select("*").execute()
-                shifts_data = response.data
-                return [Shift.from_dict(s, all_users) for s in shifts_data]
+                return response.data
             except Exception as e:
                 st.error(f"Errore caricamento Turni dal DB: {e}")
                 return []
         return []
 
+    @staticmethod
+    def load_shifts(all_users: List[User]) -> List[Shift]:
+        # Only the raw rows are cached (cache_data pickles its return value,
+        # which would hand back copies of the User objects); reconstruction
+        # happens here so shifts always reference the live roster
+        by_email = {u.email: u for u in all_users}
+        return [Shift.from_dict(s, by_email) for s in DataManager._load_shift_rows()]
+
     @staticmethod
     def save_shifts(shifts: List[Shift]):
         sb = DataManager._get_supabase()
@@ -138,29 +206,54 @@ class DataManager:
                 if shifts:
                     data = [s.to_dict() for s in shifts]
                     sb.table("shifts").insert(data).execute()
+                DataManager._load_shift_rows.clear()
                 return True
             except Exception as e:
                 st.error(f"Errore salvataggio Turni su DB: {e}")
                 return False
         return False
 
-def parse_excel_schedule(file) -> List[Lesson]:
-    try:
-        df = pd.read_excel(file, header=None)
-    except Exception as e:
-        print(f"Error reading excel: {e}")
-        return []
+    @staticmethod
+    def upsert_shift(shift: Shift):
+        """Writes a single shift (keyed on lesson key) instead of rewriting the whole list."""
+        sb = DataManager._get_supabase()
+        if sb:
+            try:
+                sb.table("shifts").upsert(shift.to_dict(), on_conflict="key").execute()
+                DataManager._load_shift_rows.clear()
+                return True
+            except Exception as e:
+                st.error(f"Errore salvataggio Turno su DB: {e}")
+                return False
+        return False
 
+    @staticmethod
+    def delete_shift(shift_key: str):
+        """Deletes a single shift row by its lesson key."""
+        sb = DataManager._get_supabase()
+        if sb:
+            try:
+                sb.table("shifts").delete().eq("key", shift_key).execute()
+                DataManager._load_shift_rows.clear()
+                return True
+            except Exception as e:
+                st.error(f"Errore eliminazione Turno dal DB: {e}")
+                return False
+        return False
+
+def _parse_rows(rows) -> List[Lesson]:
+    """Scans an iterable of cell sequences (one per spreadsheet row) for lessons."""
     lessons = []
-    
+
     # Map column index to current date for the block
-    col_to_date = {} 
-    
-    # Italian days mapping for robustness
-    # Looking for pattern "day dd/mm"
-    date_pattern = r"(lun|mar|mer|gio|ven|sab|dom).*?(\d{1,2})/(\d{1,2})"
+    col_to_date = {}
+
+    # Year guess for dd/mm headers, computed once for the whole scan
+    today = date.today()
+    base_year = today.year
+    past_august = today.month > 8
 
-    for index, row in df.iterrows():
+    for row in rows:
         # Check if this is a "Header Row" containing dates
         row_is_header = False
         new_dates_found = {}
@@ -170,19 +263,20 @@ def parse_excel_schedule(file) -> List[Lesson]:
                 continue
             
             s_val = str(cell_value).lower().strip()
-            # Check for date pattern
-            match = re.search(date_pattern, s_val)
+            # Cheap prefilter: a header cell always contains '/', most cells don't
+            if '/' not in s_val:
+                continue
+            match = _DATE_RE.search(s_val)
             if match:
                 try:
                     day = int(match.group(2))
                     month = int(match.group(3))
                     
                     # Guess Year (MVP: Current Year)
-                    today = date.today()
-                    year = today.year
+                    year = base_year
                     # Simple heuristic for Academic Year crossing (e.g. Jan 2026 vs Sept 2025)
-                    if month < 8 and today.month > 8:
-                        year += 1 
+                    if month < 8 and past_august:
+                        year += 1
                         
                     d_obj = date(year, month, day)
                     new_dates_found[col_idx] = d_obj
@@ -212,25 +306,23 @@ def parse_excel_schedule(file) -> List[Lesson]:
             if not lines:
                 continue
                 
-            # Regex for Time (e.g., 09:30 - 13:30 or 09.30-13.30)
-            time_pattern = r"(\d{1,2}[:\.]\d{2})\s*-\s*(\d{1,2}[:\.]\d{2})"
             found_time = False
             duration = 2.0
             start_str = "00:00"
             
             # Scan lines for time (usually at end)
             for i in range(len(lines)-1, -1, -1):
-                t_match = re.search(time_pattern, lines[i])
+                t_match = _TIME_RE.search(lines[i])
                 if t_match:
                     start_str = t_match.group(1).replace('.', ':')
                     end_str = t_match.group(2).replace('.', ':')
                     found_time = True
                     
                     try:
-                        fmt = "%H:%M"
-                        t1 = datetime.strptime(start_str, fmt)
-                        t2 = datetime.strptime(end_str, fmt)
-                        duration = (t2 - t1).total_seconds() / 3600
+                        # Fixed "H:MM"/"HH:MM" format; int slicing beats strptime
+                        sh, sm = int(start_str[:-3]), int(start_str[-2:])
+                        eh, em = int(end_str[:-3]), int(end_str[-2:])
+                        duration = ((eh * 60 + em) - (sh * 60 + sm)) / 60.0
                     except:
                         pass
                     break
@@ -249,29 +341,72 @@ def parse_excel_schedule(file) -> List[Lesson]:
                     duration_hours=duration
                 )
                 lessons.append(l)
-            
+
+    return lessons
+
+def _parse_workbook(xl: pd.ExcelFile) -> List[Lesson]:
+    lessons = []
+    for sheet in xl.sheet_names:
+        df = xl.parse(sheet, header=None)
+        # Plain ndarray rows; iterrows builds a Series per row and is ~10x slower
+        lessons.extend(_parse_rows(df.to_numpy(dtype=object)))
     return lessons
 
+@st.cache_data(show_spinner=False, hash_funcs={UploadedFile: lambda f: hashlib.md5(f.getvalue()).hexdigest()})
+def parse_excel_schedule(file) -> List[Lesson]:
+    # Fastest path: Rust-backed calamine reader, if python-calamine is installed
+    try:
+        return _parse_workbook(pd.ExcelFile(file, engine="calamine"))
+    except ImportError:
+        pass
+    except Exception as e:
+        print(f"Error reading excel (calamine): {e}")
+    if hasattr(file, 'seek'):
+        file.seek(0)
+
+    # Fast path: stream plain values in read-only mode, no per-cell objects
+    if openpyxl is not None:
+        try:
+            wb = openpyxl.load_workbook(file, read_only=True, data_only=True)
+            lessons = []
+            for ws in wb.worksheets:
+                lessons.extend(_parse_rows(ws.iter_rows(values_only=True)))
+            wb.close()
+            return lessons
+        except Exception as e:
+            print(f"Error reading excel (read-only mode): {e}")
+            if hasattr(file, 'seek'):
+                file.seek(0)
+
+    # Fallback: pandas with the default engine
+    try:
+        return _parse_workbook(pd.ExcelFile(file))
+    except Exception as e:
+        print(f"Error reading excel: {e}")
+        return []
+
 class ShiftOptimizer:
     def __init__(self, users: List[User], supervision_subjects: List[str], excluded_subjects: List[str] = None):
         self.users = users
-        self.supervision_subjects = supervision_subjects
-        self.excluded_subjects = excluded_subjects if excluded_subjects else []
-        self.supervision_counters: Dict[str, int] = {s: 0 for s in supervision_subjects} 
-
-    def sort_users_by_load(self, user_list: List[User]) -> List[User]:
-        # Sort by: 1. Shifts Assigned (asc)
-        import random
-        random.shuffle(user_list) 
-        return sorted(user_list, key=lambda u: u.shifts_assigned)
+        self.supervision_subjects = frozenset(supervision_subjects)
+        self.excluded_subjects = frozenset(excluded_subjects or ())
+        self.supervision_counters: Dict[str, int] = {s: 0 for s in supervision_subjects}
+        # O(1) availability lookups instead of per-lesson list scans.
+        # Dates go in as ordinal ints: integer hashing beats date.__hash__
+        # and the UI keeps its date objects untouched
+        self._unavail = {id(u): frozenset(d.toordinal() for d in u.unavailable_dates) for u in users}
+        self._blacklist = {id(u): frozenset(u.blacklist_subjects) for u in users}
+        # Partition by role once; roles are exclusive so the per-slot filters go away
+        self.sbob_users = [u for u in users if u.role == "Sbobinatore"]
+        self.rev_users = [u for u in users if u.role == "Revisore"]
 
     def is_user_available(self, user: User, lesson: Lesson) -> bool:
         # 1. Unavailability Dates
-        if lesson.date in user.unavailable_dates:
+        if lesson.date.toordinal() in self._unavail[id(user)]:
             return False
-            
+
         # 2. Blacklist
-        if lesson.subject in user.blacklist_subjects:
+        if lesson.subject in self._blacklist[id(user)]:
             return False
             
         # 3. Distance constraint (e.g. max 1 shift per day)
@@ -282,14 +417,49 @@ class ShiftOptimizer:
 
     def generate_shifts(self, lessons: List[Lesson]) -> List[Shift]:
         shifts = []
-        
+
+        # One random tiebreak per user per run keeps ties fair. Heap entries
+        # are (shifts_assigned, tiebreak, user): picking k users is k pops of
+        # the least-loaded, and picked users go back in with their new load,
+        # so the candidate list is never re-sorted per lesson.
+        rand_key = {id(u): random.random() for u in self.users}
+        sbob_heap = [(u.shifts_assigned, rand_key[id(u)], u) for u in self.sbob_users]
+        rev_heap = [(u.shifts_assigned, rand_key[id(u)], u) for u in self.rev_users]
+        heapq.heapify(sbob_heap)
+        heapq.heapify(rev_heap)
+
+        # Bind the constraint tables to locals; the inner loop then touches
+        # only dict/set lookups on primitives instead of method dispatch
+        unavail = self._unavail
+        blacklist = self._blacklist
+        heappush, heappop = heapq.heappush, heapq.heappop
+
+        def pick(heap, needed, lesson):
+            picked, unavailable = [], []
+            ldate, lsubj = lesson.date, lesson.subject
+            lord = ldate.toordinal()
+            while heap and len(picked) < needed:
+                entry = heappop(heap)
+                u = entry[2]
+                uid = id(u)
+                # Same checks as is_user_available, inlined for the hot loop
+                if lord in unavail[uid] or lsubj in blacklist[uid] or u.last_shift_date == ldate:
+                    unavailable.append(entry)
+                else:
+                    picked.append(u)
+            # Users skipped for this lesson keep their position for the next
+            for entry in unavailable:
+                heappush(heap, entry)
+            return picked
+
+        # Drop excluded subjects up front; the main loop only sees work items
+        if self.excluded_subjects:
+            lessons = [l for l in lessons if l.subject not in self.excluded_subjects]
+
         # In a real app, sorting lessons chronologically is crucial here
         # lessons.sort(key=...)
 
         for lesson in lessons:
-            if lesson.subject in self.excluded_subjects:
-                continue
-
             is_supervision = lesson.subject in self.supervision_subjects
             lesson.is_supervision = is_supervision
             
@@ -319,33 +489,16 @@ class ShiftOptimizer:
                     needed_sbob = 4
                     needed_rev = 2
             
-            # Find candidates
-            candidates = [u for u in self.users if self.is_user_available(u, lesson)]
-            candidates = self.sort_users_by_load(candidates)
-            
-            assigned_sbob = []
-            assigned_rev = []
-            
-            # Assign Sbobinatori
-            for _ in range(needed_sbob):
-                # Filter for Sbobinatori
-                valid_c = [c for c in candidates if c.role == "Sbobinatore" and c not in assigned_sbob and c not in assigned_rev]
-                if valid_c:
-                    selected = valid_c[0]
-                    selected.shifts_assigned += 1
-                    selected.last_shift_date = lesson.date
-                    assigned_sbob.append(selected)
-            
-            # Assign Revisori
-            for _ in range(needed_rev):
-                # Filter for Revisore
-                valid_c = [c for c in candidates if c.role == "Revisore" and c not in assigned_sbob and c not in assigned_rev]
-                if valid_c:
-                    selected = valid_c[0]
+            assigned_sbob = pick(sbob_heap, needed_sbob, lesson)
+            assigned_rev = pick(rev_heap, needed_rev, lesson)
+
+            for heap, assigned in ((sbob_heap, assigned_sbob), (rev_heap, assigned_rev)):
+                for selected in assigned:
                     selected.shifts_assigned += 1
                     selected.last_shift_date = lesson.date
-                    assigned_rev.append(selected)
-            
+                    selected._dirty = True
+                    heapq.heappush(heap, (selected.shifts_assigned, rand_key[id(selected)], selected))
+
             shifts.append(Shift(lesson, assigned_sbob, assigned_rev))
             
         return shifts